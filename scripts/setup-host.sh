@@ -48,8 +48,13 @@ for i in {0..4}; do
     fi
 done
 
-# Read CPU frequency
-CPU_FREQ=$(grep MHz /proc/cpuinfo | head -1 | awk '{print $4}' | cut -d'.' -f1)
+# Read CPU frequency (cpufreq reports kHz; fall back to /proc/cpuinfo)
+CPUFREQ_FILE=/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq
+if [ -r "$CPUFREQ_FILE" ]; then
+    CPU_FREQ=$(($(cat "$CPUFREQ_FILE")/1000))
+else
+    CPU_FREQ=$(grep MHz /proc/cpuinfo | head -1 | awk '{print $4}' | cut -d'.' -f1)
+fi
 
 # Read system load
 LOAD_1MIN=$(cat /proc/loadavg | awk '{print $1}')
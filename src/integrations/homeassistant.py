@@ -5,9 +5,38 @@ Handles sensor updates and notifications
 """
 
 import json
+import time
+import socket
 import logging
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from ..utils.serialization import dumps
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter with Nagle disabled and TCP keepalive enabled"""
+
+    # urllib3's defaults already carry TCP_NODELAY; add SO_KEEPALIVE with
+    # short timings (the kernel default idle time is 2 h) so pooled
+    # connections idle between ticks are probed every 20 s, keeping NAT and
+    # firewall state alive, and a dead peer is dropped after ~35 s
+    socket_options = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ] + [
+        (socket.IPPROTO_TCP, getattr(socket, name), value)
+        for name, value in (('TCP_KEEPIDLE', 20), ('TCP_KEEPINTVL', 5), ('TCP_KEEPCNT', 3))
+        if hasattr(socket, name)  # Linux-specific
+    ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
 
 
 class HomeAssistantClient:
@@ -20,72 +49,194 @@ class HomeAssistantClient:
         self.base_url = config['url'].rstrip('/')
         self.token = config['token']
         self.timeout = config.get('timeout', 10)
+
+        # Precomputed endpoint URLs for the per-tick calls
+        self._states_url_prefix = f'{self.base_url}/api/states/sensor.'
+        self._services_notify_url = f'{self.base_url}/api/services/notify/notify'
+
+        # Connection test result cache (seconds)
+        self._test_ttl = config.get('connection_test_ttl', 30)
+        self._last_test_ok = False
+        self._last_test_ts = None
+
+        # Outcome of the most recent API call, for cheap status reporting;
+        # None until the first call has been made
+        self.ha_last_ok = None
+
+        # Whether the last request got any HTTP response back, even an error
+        # status; False only after a transport failure. None until then
+        self.ha_reachable = None
         
         self.headers = {
             'Authorization': f'Bearer {self.token}',
             'Content-Type': 'application/json'
         }
+
+        # Reuse one pooled keep-alive connection for all API calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.hooks['response'].append(self._mark_reachable)
+        # Keep per-call retries short so a tick never stalls on a dead HA;
+        # no read retries, as a slow POST may already have been applied
+        retries, backoff = 2, 0.3
+        adapter = KeepAliveAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=Retry(total=retries, backoff_factor=backoff, read=0)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Worker pool so batched updates overlap their round-trips; kept
+        # small so bursts don't overwhelm HA or a flaky Wi-Fi link
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get('max_concurrency', 4),
+            thread_name_prefix='ha-update'
+        )
+
+        # Longest a single call can take: every attempt timing out plus the
+        # backoff sleeps between them
+        self._call_budget = (retries + 1) * self.timeout + sum(
+            backoff * 2 ** n for n in range(retries)
+        )
+
+        # Latest queued update per entity, and a lock per entity so an older
+        # in-flight update always finishes before a newer one is posted
+        self._entity_seq = {}
+        self._entity_locks = {}
+        self._seq_lock = threading.Lock()
         
-    def test_connection(self):
-        """Test connection to Home Assistant"""
+    def _mark_reachable(self, response, *args, **kwargs):
+        """Session response hook: any response means HA is reachable"""
+        self.ha_reachable = True
+
+    def test_connection(self, force=False):
+        """Test connection to Home Assistant
+
+        The result is cached for ``connection_test_ttl`` seconds; pass
+        ``force=True`` to always probe the API.
+        """
+        now = time.monotonic()
+        if (not force and self._last_test_ts is not None
+                and now - self._last_test_ts < self._test_ttl):
+            return self._last_test_ok
+
+        self._last_test_ok = self._probe_connection()
+        self._last_test_ts = now
+        return self._last_test_ok
+
+    def _probe_connection(self):
+        """Probe the Home Assistant API root"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/api/',
-                headers=self.headers,
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
                 self.logger.debug("Home Assistant connection test successful")
+                self.ha_last_ok = True
                 return True
             else:
                 self.logger.error(f"HA connection test failed: {response.status_code}")
+                self.ha_last_ok = False
                 return False
                 
         except Exception as e:
             self.logger.error(f"HA connection test error: {e}")
+            self.ha_last_ok = False
             return False
             
-    def update_sensor(self, entity_id, state, attributes=None):
-        """Update sensor state in Home Assistant"""
+    def update_sensor(self, entity_id, state, attributes=None, timestamp=None):
+        """Update sensor state in Home Assistant
+
+        ``timestamp`` is the ISO string used for the ``last_updated``
+        attribute; it defaults to the current time.
+        """
         try:
-            url = f'{self.base_url}/api/states/sensor.{entity_id}'
+            url = self._states_url_prefix + entity_id
             
+            # Add default attributes on a copy; callers may pass shared dicts
             data = {
                 'state': str(state),
-                'attributes': attributes or {}
+                'attributes': {
+                    **(attributes or {}),
+                    'last_updated': timestamp or datetime.now().isoformat(),
+                    'source': 'nucbox-monitoring'
+                }
             }
             
-            # Add default attributes
-            data['attributes'].update({
-                'last_updated': datetime.now().isoformat(),
-                'source': 'nucbox-monitoring'
-            })
-            
-            response = requests.post(
+            response = self.session.post(
                 url,
-                headers=self.headers,
-                json=data,
+                data=dumps(data),
                 timeout=self.timeout
             )
             
             if response.status_code in [200, 201]:
-                self.logger.debug(f"Updated sensor {entity_id}: {state}")
+                self.logger.debug("Updated sensor %s: %s", entity_id, state)
+                self.ha_last_ok = True
                 return True
             else:
                 self.logger.error(
                     f"Failed to update sensor {entity_id}: {response.status_code} - {response.text}"
                 )
+                self.ha_last_ok = False
                 return False
                 
         except Exception as e:
             self.logger.error(f"Error updating sensor {entity_id}: {e}")
+            self.ha_last_ok = False
+            if isinstance(e, requests.exceptions.RequestException):
+                self.ha_reachable = False
             return False
             
+    def update_sensors(self, sensors):
+        """Update several sensors concurrently over the pooled session
+
+        Home Assistant has no native bulk state endpoint, so the updates are
+        issued in parallel on the shared keep-alive connections. The call
+        waits for the batch at most as long as one call can take with its
+        retries. Returns a dict mapping each entity_id to whether its update
+        succeeded; updates still pending when the wait expires are cancelled
+        and count as failed. An update still running from an earlier batch
+        is never overtaken: the newer value is posted after it finishes.
+        """
+        # One timestamp for the whole batch
+        timestamp = datetime.now().isoformat()
+        futures = {}
+        with self._seq_lock:
+            for entity_id, state, attributes in sensors:
+                seq = self._entity_seq.get(entity_id, 0) + 1
+                self._entity_seq[entity_id] = seq
+                self._entity_locks.setdefault(entity_id, threading.Lock())
+                futures[entity_id] = self._executor.submit(
+                    self._update_latest, entity_id, seq, state, attributes, timestamp
+                )
+
+        _, not_done = wait(futures.values(), timeout=self._call_budget + 2)
+        if not_done:
+            self.logger.warning(f"{len(not_done)} sensor update(s) did not finish in time")
+            # Drop queued updates so stale values don't replay behind hung ones
+            for future in not_done:
+                future.cancel()
+
+        return {
+            entity_id: future not in not_done and future.result()
+            for entity_id, future in futures.items()
+        }
+            
+    def _update_latest(self, entity_id, seq, state, attributes, timestamp):
+        """Post an update unless a newer one for the entity was queued since"""
+        with self._entity_locks[entity_id]:
+            if self._entity_seq.get(entity_id) != seq:
+                self.logger.debug("Skipping superseded update for %s", entity_id)
+                return False
+            return self.update_sensor(entity_id, state, attributes, timestamp)
+            
     def send_notification(self, title, message, data=None):
         """Send notification through Home Assistant"""
         try:
-            url = f'{self.base_url}/api/services/notify/notify'
+            url = self._services_notify_url
             
             payload = {
                 'message': message,
@@ -99,24 +250,26 @@ class HomeAssistantClient:
                 'source': 'nucbox-monitoring'
             })
             
-            response = requests.post(
+            response = self.session.post(
                 url,
-                headers=self.headers,
-                json=payload,
+                data=dumps(payload),
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
                 self.logger.debug(f"Notification sent: {title}")
+                self.ha_last_ok = True
                 return True
             else:
                 self.logger.error(
                     f"Failed to send notification: {response.status_code} - {response.text}"
                 )
+                self.ha_last_ok = False
                 return False
                 
         except Exception as e:
             self.logger.error(f"Error sending notification: {e}")
+            self.ha_last_ok = False
             return False
             
     def call_service(self, domain, service, service_data=None):
@@ -124,40 +277,42 @@ class HomeAssistantClient:
         try:
             url = f'{self.base_url}/api/services/{domain}/{service}'
             
-            response = requests.post(
+            response = self.session.post(
                 url,
-                headers=self.headers,
-                json=service_data or {},
+                data=dumps(service_data or {}),
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
                 self.logger.debug(f"Service called: {domain}.{service}")
+                self.ha_last_ok = True
                 return True
             else:
                 self.logger.error(
                     f"Failed to call service {domain}.{service}: "
                     f"{response.status_code} - {response.text}"
                 )
+                self.ha_last_ok = False
                 return False
                 
         except Exception as e:
             self.logger.error(f"Error calling service {domain}.{service}: {e}")
+            self.ha_last_ok = False
             return False
             
     def get_sensor_state(self, entity_id):
         """Get current state of a sensor"""
         try:
-            url = f'{self.base_url}/api/states/sensor.{entity_id}'
+            url = self._states_url_prefix + entity_id
             
-            response = requests.get(
+            response = self.session.get(
                 url,
-                headers=self.headers,
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
                 data = response.json()
+                self.ha_last_ok = True
                 return {
                     'state': data.get('state'),
                     'attributes': data.get('attributes', {}),
@@ -166,10 +321,12 @@ class HomeAssistantClient:
                 }
             else:
                 self.logger.error(f"Failed to get sensor state {entity_id}: {response.status_code}")
+                self.ha_last_ok = False
                 return None
                 
         except Exception as e:
             self.logger.error(f"Error getting sensor state {entity_id}: {e}")
+            self.ha_last_ok = False
             return None
             
     def create_sensor_config(self, entity_id, name, config):
@@ -183,18 +340,25 @@ class HomeAssistantClient:
         try:
             url = f'{self.base_url}/api/config'
             
-            response = requests.get(
+            response = self.session.get(
                 url,
-                headers=self.headers,
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
+                self.ha_last_ok = True
                 return response.json()
             else:
                 self.logger.error(f"Failed to get system info: {response.status_code}")
+                self.ha_last_ok = False
                 return None
                 
         except Exception as e:
             self.logger.error(f"Error getting system info: {e}")
-            return None
\ No newline at end of file
+            self.ha_last_ok = False
+            return None
+
+    def close(self):
+        """Close the worker pool and the underlying HTTP session"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
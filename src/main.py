@@ -6,7 +6,6 @@ Coordinates thermal monitoring and integrations with Home Assistant
 
 import sys
 import json
-import time
 import signal
 import logging
 import argparse
@@ -30,6 +29,7 @@ class MonitoringHub:
         self.config = self.load_config()
         self.logger = setup_logging(self.config.get('logging', {}))
         self.running = False
+        self._stop_event = threading.Event()
 
         # Log config load now that logger is available
         self.logger.info(f"Configuration loaded from {self.config_path}")
@@ -72,27 +72,23 @@ class MonitoringHub:
         
         try:
             # Test Home Assistant connection
-            retry_interval = 30
-            while not self.ha_client.test_connection():
-                self.logger.warning(
-                    f"Cannot reach Home Assistant, retrying in {retry_interval}s..."
-                )
-                time.sleep(retry_interval)
+            reachable = self._wait_for_home_assistant()
+            if reachable is None:
+                # Shutdown requested while waiting; not an error
+                return True
+            if not reachable:
+                self.logger.error("Cannot reach Home Assistant, giving up")
+                return False
                 
             self.running = True
             
-            # Start thermal monitor
-            thermal_thread = threading.Thread(
-                target=self.thermal_monitor.start,
-                daemon=True
-            )
-            thermal_thread.start()
+            # Start thermal monitor (spawns its own workers and returns)
+            self.thermal_monitor.start()
             
             self.logger.info("Monitoring hub started successfully")
             
-            # Main loop
-            while self.running:
-                time.sleep(1)
+            # Block until a shutdown signal arrives
+            self._stop_event.wait()
                 
         except Exception as e:
             self.logger.error(f"Error in monitoring hub: {e}", exc_info=True)
@@ -100,15 +96,45 @@ class MonitoringHub:
             
         return True
         
+    def _wait_for_home_assistant(self):
+        """Probe Home Assistant with exponential backoff until it answers
+
+        Returns True once HA answers, False after ``homeassistant.retries``
+        failed probes, and None if a shutdown is requested while waiting.
+        """
+        ha_config = self.config['homeassistant']
+        attempts = ha_config.get('retries', 10)
+        delay = ha_config.get('retry_backoff', 1.0)
+        
+        for attempt in range(1, attempts + 1):
+            if self.ha_client.test_connection(force=True):
+                return True
+            if attempt == attempts:
+                break
+                
+            self.logger.warning(
+                f"Cannot reach Home Assistant (attempt {attempt}/{attempts}), "
+                f"retrying in {delay:g}s..."
+            )
+            if self._stop_event.wait(delay):
+                return None
+            delay = min(delay * 2, 60)
+            
+        return False
+        
     def stop(self):
         """Stop the monitoring hub"""
         self.logger.info("Stopping monitoring hub")
         self.running = False
+        self._stop_event.set()
         
         # Stop thermal monitor
         if hasattr(self.thermal_monitor, 'stop'):
             self.thermal_monitor.stop()
-            
+
+        # Release pooled Home Assistant connections
+        self.ha_client.close()
+
     def check_config(self):
         """Validate configuration"""
         required_keys = [
@@ -137,10 +163,15 @@ class MonitoringHub:
         
     def get_status(self):
         """Get current monitoring status"""
+        # Use the last call's outcome; probe (TTL-cached) if none was made yet
+        ha_connection = self.ha_client.ha_last_ok
+        if ha_connection is None:
+            ha_connection = self.ha_client.test_connection()
+            
         return {
             'running': self.running,
             'thermal_monitor': self.thermal_monitor.get_status(),
-            'ha_connection': self.ha_client.test_connection(),
+            'ha_connection': ha_connection,
             'config_path': str(self.config_path)
         }
 
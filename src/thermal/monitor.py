@@ -4,15 +4,145 @@ Thermal monitoring module for NucBox G5
 Handles temperature sensors, fan states, and thermal events
 """
 
-import json
-import time
+import os
 import logging
 import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
 from .sensors import SensorReader
+from ..utils.serialization import dumps, loads
+
+
+# Static Home Assistant sensor attributes, shared across updates
+SOCKET_TEMP_ATTRS = {
+    'unit_of_measurement': '°C',
+    'device_class': 'temperature',
+    'friendly_name': 'NucBox Socket Temperature'
+}
+CPU_TEMP_ATTRS = {
+    'unit_of_measurement': '°C',
+    'device_class': 'temperature',
+    'friendly_name': 'NucBox CPU Temperature'
+}
+CPU_FREQ_ATTRS = {
+    'unit_of_measurement': 'MHz',
+    'device_class': 'frequency',
+    'friendly_name': 'NucBox CPU Frequency',
+    'icon': 'mdi:chip'
+}
+FAN_ACTIVE_ATTRS = {
+    'device_class': 'running',
+    'friendly_name': 'NucBox Fans Active'
+}
+CPU_THROTTLING_ATTRS = {
+    'device_class': 'problem',
+    'friendly_name': 'NucBox CPU Throttling'
+}
+LOAD_AVG_ATTRS = {
+    'friendly_name': 'NucBox Load Average',
+    'unit_of_measurement': 'load'
+}
+
+
+class DataFileHandler(FileSystemEventHandler):
+    """Forward completed writes of the thermal data file to the monitor"""
+
+    def __init__(self, thermal_monitor, data_file):
+        super().__init__()
+        self.thermal_monitor = thermal_monitor
+        self.data_file = data_file
+
+    def on_closed(self, event):
+        # Fired on IN_CLOSE_WRITE, i.e. once the writer has finished
+        if Path(event.src_path) == self.data_file:
+            self.thermal_monitor._load_data_file(self.data_file)
+
+    def on_moved(self, event):
+        # Atomic replace via rename onto the data file
+        if Path(event.dest_path) == self.data_file:
+            self.thermal_monitor._load_data_file(self.data_file)
+
+    def on_created(self, event):
+        # A file moved in from an unwatched directory only shows up as a
+        # create. A freshly opened file is still empty; its close event
+        # follows once the writer is done, so skip it here
+        if Path(event.src_path) == self.data_file:
+            try:
+                if self.data_file.stat().st_size == 0:
+                    return
+            except OSError:
+                return
+            self.thermal_monitor._load_data_file(self.data_file)
+
+
+class ThermalHandler(BaseHTTPRequestHandler):
+    """HTTP handler for thermal data pushes and health checks
+
+    The owning ThermalMonitor is reached through ``self.server.thermal_monitor``
+    and the body size cap through ``self.server.max_body_size``.
+    """
+
+    # Socket timeout so a slow or stalled sender can't block the server
+    timeout = 5
+
+    def do_POST(self):
+        thermal_monitor = self.server.thermal_monitor
+        if self.path == '/thermal-data':
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            if content_length <= 0:
+                self.send_response(411)
+                self.end_headers()
+                return
+            if content_length > self.server.max_body_size:
+                self.send_response(413)
+                self.end_headers()
+                return
+
+            try:
+                thermal_data = loads(self.rfile.read(content_length))
+                
+                thermal_monitor.process_thermal_data(thermal_data)
+                
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b'OK')
+            except Exception as e:
+                thermal_monitor.logger.error(f"HTTP handler error: {e}")
+                self.send_response(500)
+                self.end_headers()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            health_data = {
+                'status': 'healthy',
+                'timestamp': datetime.now().isoformat(),
+                'monitoring': self.server.thermal_monitor.get_status()
+            }
+            self.wfile.write(dumps(health_data))
+        else:
+            self.send_response(404)
+            self.end_headers()
+            
+    def log_message(self, format, *args):
+        # Suppress HTTP logs
+        pass
 
 
 class ThermalMonitor:
@@ -31,20 +161,48 @@ class ThermalMonitor:
 
         # Configuration
         self.monitoring_config = config.get('monitoring', {})
+        self.data_file = Path(self.monitoring_config.get('data_file', '/tmp/nucbox-thermal.json'))
+        self.poll_interval = self.monitoring_config.get('interval', 30)
+        self.max_poll_interval = self.monitoring_config.get('max_poll_interval', 300)
+        self.http_port = self.monitoring_config.get('http_port', 8080)
+        self.http_max_body = self.monitoring_config.get('http_max_body', 64 * 1024)
+
+        # Unchanged sensors are re-sent every N updates as a heartbeat
+        self.heartbeat_ticks = self.monitoring_config.get('heartbeat_ticks', 10)
+        self._ticks_since_heartbeat = 0
+
+        # HA reachability seen after the previous sensor batch
+        self._ha_reachable = None
+
+        # Samples arriving within this window (seconds) are coalesced and
+        # only the latest is processed; 0 processes every sample inline
+        self.coalesce_window = self.monitoring_config.get('coalesce_window', 0.5)
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        self._pending_event = threading.Event()
+        self._coalescing = False
         
         # Threading
         self.running = False
+        self._stop_event = threading.Event()
         self.http_server = None
+        self.file_observer = None
         
     def start(self):
         """Start thermal monitoring"""
         self.logger.info("Starting thermal monitoring")
         self.running = True
+        self._stop_event.clear()
+
+        # Start the coalescing consumer before any producer
+        if self.coalesce_window > 0:
+            self._coalescing = True
+            coalesce_thread = threading.Thread(target=self._coalesce_loop, daemon=True)
+            coalesce_thread.start()
         
         # Start file monitor if enabled
         if self.monitoring_config.get('enable_file_monitor', True):
-            file_thread = threading.Thread(target=self._file_monitor, daemon=True)
-            file_thread.start()
+            self._start_file_monitor()
             
         # Start HTTP server if enabled
         if self.monitoring_config.get('enable_http_server', True):
@@ -57,154 +215,225 @@ class ThermalMonitor:
         """Stop thermal monitoring"""
         self.logger.info("Stopping thermal monitoring")
         self.running = False
-        
+        self._coalescing = False
+        self._stop_event.set()
+        self._pending_event.set()
+
+        if self.file_observer:
+            self.file_observer.stop()
+
         if self.http_server:
             self.http_server.shutdown()
+
+        self.sensor_reader.close()
             
-    def _file_monitor(self):
-        """Monitor thermal data file for changes"""
-        data_file = Path(self.monitoring_config.get('data_file', '/tmp/nucbox-thermal.json'))
-        last_modified = 0
+    def _start_file_monitor(self):
+        """Monitor thermal data file for changes using inotify
+
+        The watchdog observer runs its own thread; a polling thread is only
+        started when the watch cannot be set up.
+        """
+        data_file = self.data_file
         
         self.logger.info(f"Starting file monitor for {data_file}")
-        
+
+        try:
+            observer = Observer()
+            observer.schedule(DataFileHandler(self, data_file), str(data_file.parent))
+            observer.start()
+        except Exception as e:
+            # e.g. missing directory or inotify watch limit reached
+            self.logger.warning(f"File watcher unavailable ({e}), falling back to polling")
+            poll_thread = threading.Thread(
+                target=self._poll_file_monitor,
+                args=(data_file,),
+                daemon=True
+            )
+            poll_thread.start()
+            return
+
+        self.file_observer = observer
+
+        # Pick up whatever the collector wrote before we started watching
+        if data_file.exists():
+            self._load_data_file(data_file)
+
+    def _poll_file_monitor(self, data_file):
+        """Poll thermal data file for changes
+
+        The sleep doubles while the file stays unchanged, up to
+        ``max_poll_interval``, and drops back to ``interval`` on a change.
+        """
+        interval = self.poll_interval
+        max_interval = self.max_poll_interval
+        sleep_for = interval
+        last_modified = 0
+
         while self.running:
             try:
-                if data_file.exists():
-                    current_modified = data_file.stat().st_mtime
-                    
+                # Single stat per tick; integer ns avoids float precision loss
+                try:
+                    current_modified = os.stat(data_file).st_mtime_ns
+                except FileNotFoundError:
+                    current_modified = None
+
+                if current_modified is not None:
                     if current_modified > last_modified:
-                        with open(data_file, 'r') as f:
-                            thermal_data = json.load(f)
-                            
-                        self.process_thermal_data(thermal_data)
+                        self._load_data_file(data_file)
                         last_modified = current_modified
+                        sleep_for = interval
+                    else:
+                        sleep_for = min(sleep_for * 2, max_interval)
                         
             except Exception as e:
                 self.logger.error(f"File monitoring error: {e}")
                 
-            time.sleep(self.monitoring_config.get('interval', 30))
+            self._stop_event.wait(sleep_for)
+
+    def _load_data_file(self, data_file):
+        """Read the thermal data file and process its contents"""
+        try:
+            with open(data_file, 'rb') as f:
+                thermal_data = loads(f.read())
+
+            self.process_thermal_data(thermal_data)
+
+        except Exception as e:
+            self.logger.error(f"File monitoring error: {e}")
             
     def _start_http_server(self):
         """Start HTTP server for receiving thermal data"""
-        port = self.monitoring_config.get('http_port', 8080)
+        port = self.http_port
         
-        class ThermalHandler(BaseHTTPRequestHandler):
-            def __init__(self, thermal_monitor):
-                self.thermal_monitor = thermal_monitor
-                
-            def __call__(self, *args, **kwargs):
-                super().__init__(*args, **kwargs)
-                
-            def do_POST(self):
-                if self.path == '/thermal-data':
-                    try:
-                        content_length = int(self.headers['Content-Length'])
-                        thermal_data = json.loads(self.rfile.read(content_length))
-                        
-                        self.thermal_monitor.process_thermal_data(thermal_data)
-                        
-                        self.send_response(200)
-                        self.end_headers()
-                        self.wfile.write(b'OK')
-                    except Exception as e:
-                        self.thermal_monitor.logger.error(f"HTTP handler error: {e}")
-                        self.send_response(500)
-                        self.end_headers()
-                else:
-                    self.send_response(404)
-                    self.end_headers()
-                    
-            def do_GET(self):
-                if self.path == '/health':
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    health_data = {
-                        'status': 'healthy',
-                        'timestamp': datetime.now().isoformat(),
-                        'monitoring': self.thermal_monitor.get_status()
-                    }
-                    self.wfile.write(json.dumps(health_data).encode())
-                else:
-                    self.send_response(404)
-                    self.end_headers()
-                    
-            def log_message(self, format, *args):
-                # Suppress HTTP logs
-                pass
-                
         try:
-            handler = lambda *args, **kwargs: ThermalHandler(self)(*args, **kwargs)
-            self.http_server = HTTPServer(('0.0.0.0', port), handler)
+            self.http_server = HTTPServer(('0.0.0.0', port), ThermalHandler)
+            self.http_server.thermal_monitor = self
+            self.http_server.max_body_size = self.http_max_body
             self.logger.info(f"HTTP server started on port {port}")
             self.http_server.serve_forever()
         except Exception as e:
             self.logger.error(f"HTTP server error: {e}")
             
     def process_thermal_data(self, data):
-        """Process thermal data and handle events"""
+        """Process thermal data and handle events
+
+        While monitoring is running, bursts of samples are coalesced by the
+        consumer thread; otherwise the sample is handled immediately.
+        """
+        if not self._coalescing:
+            self._handle_thermal_data(data)
+            return
+
+        with self._pending_lock:
+            self._pending = data
+            self._pending_event.set()
+
+    def _coalesce_loop(self):
+        """Process the latest pending sample after each coalescing window"""
+        while not self._stop_event.is_set():
+            self._pending_event.wait()
+
+            # Let further samples in the window overwrite the pending one
+            if self._stop_event.wait(self.coalesce_window):
+                break
+
+            with self._pending_lock:
+                data = self._pending
+                self._pending = None
+                self._pending_event.clear()
+
+            if data is not None:
+                self._handle_thermal_data(data)
+
+    def _handle_thermal_data(self, data):
+        """Normalize a thermal sample and push it to Home Assistant"""
         try:
-            # Extract data
-            socket_temp = int(data.get('socket_temp', 0))
-            cpu_temp = int(data.get('cpu_temp', 0))
-            fan_active = bool(data.get('fan_active', False))
-            cpu_freq = int(data.get('cpu_freq', 0))
-            load_avg = float(data.get('load_avg', 0.0))
-            fan_states = data.get('fan_states', '')
+            # Normalize field types once at the ingress boundary
+            get = data.get
+            norm = {
+                'socket_temp': int(get('socket_temp', 0)),
+                'cpu_temp': int(get('cpu_temp', 0)),
+                'fan_active': bool(get('fan_active', False)),
+                'cpu_freq': int(get('cpu_freq', 0)),
+                'load_avg': float(get('load_avg', 0.0)),
+                'fan_states': str(get('fan_states', ''))
+            }
             
             # Log current status
             self.logger.debug(
-                f"Thermal data: Socket={socket_temp}°C, CPU={cpu_temp}°C, "
-                f"Fans={fan_active}, Freq={cpu_freq}MHz, Load={load_avg}"
+                "Thermal data: Socket=%s°C, CPU=%s°C, Fans=%s, Freq=%sMHz, Load=%s",
+                norm['socket_temp'], norm['cpu_temp'], norm['fan_active'],
+                norm['cpu_freq'], norm['load_avg']
             )
             
             # Update Home Assistant sensors
-            self._update_ha_sensors(data)
+            self._update_ha_sensors(norm)
             
         except Exception as e:
             self.logger.error(f"Error processing thermal data: {e}", exc_info=True)
             
     def _update_ha_sensors(self, data):
-        """Update Home Assistant sensors with current data"""
+        """Update Home Assistant sensors with normalized thermal data"""
+        cpu_freq = data['cpu_freq']
+        cpu_throttling = cpu_freq < 3000
+
         sensors = [
-            ('nucbox_socket_temp', data['socket_temp'], {
-                'unit_of_measurement': '°C',
-                'device_class': 'temperature',
-                'friendly_name': 'NucBox Socket Temperature'
-            }),
-            ('nucbox_cpu_temp', data['cpu_temp'], {
-                'unit_of_measurement': '°C',
-                'device_class': 'temperature',
-                'friendly_name': 'NucBox CPU Temperature'
-            }),
-            ('nucbox_cpu_freq', data['cpu_freq'], {
-                'unit_of_measurement': 'MHz',
-                'device_class': 'frequency',
-                'friendly_name': 'NucBox CPU Frequency',
-                'icon': 'mdi:chip'
-            }),
+            ('nucbox_socket_temp', data['socket_temp'], SOCKET_TEMP_ATTRS),
+            ('nucbox_cpu_temp', data['cpu_temp'], CPU_TEMP_ATTRS),
+            ('nucbox_cpu_freq', cpu_freq, CPU_FREQ_ATTRS),
             ('nucbox_fan_active', int(data['fan_active']), {
-                'device_class': 'running',
-                'friendly_name': 'NucBox Fans Active',
-                'fan_states': data.get('fan_states', '')
+                **FAN_ACTIVE_ATTRS,
+                'fan_states': data['fan_states']
             }),
-            ('nucbox_cpu_throttling', int(data['cpu_freq'] < 3000), {
-                'device_class': 'problem',
-                'friendly_name': 'NucBox CPU Throttling',
-                'cpu_frequency': f"{data['cpu_freq']}MHz"
+            ('nucbox_cpu_throttling', int(cpu_throttling), {
+                **CPU_THROTTLING_ATTRS,
+                'cpu_frequency': f"{cpu_freq}MHz"
             }),
-            ('nucbox_load_avg', data['load_avg'], {
-                'friendly_name': 'NucBox Load Average',
-                'unit_of_measurement': 'load'
-            })
+            ('nucbox_load_avg', data['load_avg'], LOAD_AVG_ATTRS)
         ]
         
-        for entity_id, state, attributes in sensors:
-            try:
-                self.ha_client.update_sensor(entity_id, state, attributes)
-            except Exception as e:
-                self.logger.error(f"Failed to update sensor {entity_id}: {e}")
+        # Only push sensors whose state or attributes changed, except on
+        # heartbeat ticks where everything is refreshed
+        self._ticks_since_heartbeat += 1
+        if self._ticks_since_heartbeat >= self.heartbeat_ticks:
+            self._ticks_since_heartbeat = 0
+            changed = sensors
+        else:
+            changed = [
+                (entity_id, state, attributes)
+                for entity_id, state, attributes in sensors
+                if self.last_state.get(entity_id) != (state, attributes)
+            ]
+
+        if not changed:
+            self.logger.debug("Sensor values unchanged, skipping update")
+            return
+
+        pending = {
+            entity_id: (state, attributes)
+            for entity_id, state, attributes in changed
+        }
+
+        try:
+            results = self.ha_client.update_sensors(changed)
+        except Exception as e:
+            self.logger.error(f"Failed to update sensors: {e}")
+            return
+
+        # HA may have restarted and lost REST-set states while it was
+        # unreachable, so on reconnect forget what was sent and resend
+        # everything on the next tick. An entity rejected by HA doesn't
+        # count as the connection being down.
+        reachable = self.ha_client.ha_reachable
+        if reachable and self._ha_reachable is False:
+            self.logger.info("Home Assistant reachable again, resending all sensors")
+            self.last_state.clear()
+        if reachable is not None:
+            self._ha_reachable = reachable
+
+        for entity_id, ok in results.items():
+            if ok:
+                self.last_state[entity_id] = pending[entity_id]
 
     def test_sensors(self):
         """Test sensor reading functionality"""
@@ -228,5 +457,5 @@ class ThermalMonitor:
         return {
             'running': self.running,
             'last_state': self.last_state.copy(),
-            'ha_connection': self.ha_client.test_connection() if self.ha_client else False
+            'ha_connection': self.ha_client.ha_last_ok if self.ha_client else False
         }
\ No newline at end of file
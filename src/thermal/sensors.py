@@ -4,11 +4,28 @@ Sensor reading utilities for NucBox thermal monitoring
 Handles reading from thermal zones and cooling devices
 """
 
+import os
 import logging
 from pathlib import Path
 from datetime import datetime
 
 
+# Current frequency of the first CPU, in kHz
+CPUFREQ_FILE = '/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq'
+
+THERMAL_CLASS_DIR = '/sys/class/thermal'
+
+# Maps byte values 0-9 to their ASCII digits
+_DIGIT_TABLE = bytes.maketrans(bytes(range(10)), b'0123456789')
+
+
+def _format_fan_states(fan_states):
+    """Format fan states as a digit string, e.g. [0, 1, 0] -> '010'"""
+    if max(fan_states, default=0) < 10:
+        return bytes(fan_states).translate(_DIGIT_TABLE).decode('ascii')
+    return ''.join(map(str, fan_states))
+
+
 class SensorReader:
     """Read thermal sensor data from sysfs"""
     
@@ -20,18 +37,62 @@ class SensorReader:
         self.thermal_zone_socket = self.config.get('thermal_zone_socket', 0)
         self.thermal_zone_cpu = self.config.get('thermal_zone_cpu', 1)
         self.cooling_devices = self.config.get('cooling_devices', [0, 1, 2, 3, 4])
+
+        # Open descriptors for sysfs/procfs files, keyed by path
+        self._fds = {}
+
+        # Enumerate thermal entries once; missing ones are skipped on every
+        # poll instead of failing a lookup each time
+        try:
+            self._present = {entry.name for entry in os.scandir(THERMAL_CLASS_DIR)}
+        except OSError as e:
+            self.logger.warning(f"Cannot list {THERMAL_CLASS_DIR}: {e}")
+            self._present = set()
+
+        for zone_id in (self.thermal_zone_socket, self.thermal_zone_cpu):
+            if f'thermal_zone{zone_id}' not in self._present:
+                self.logger.warning(f"Thermal zone {zone_id} not found, reporting no temperature")
+        for device_id in self.cooling_devices:
+            if f'cooling_device{device_id}' not in self._present:
+                self.logger.warning(f"Cooling device {device_id} not found, reporting state 0")
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Close cached file descriptors"""
+        fds, self._fds = self._fds, {}
+        for fd in fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _read_file(self, path, size=64):
+        """Read a small sysfs/procfs file through a cached descriptor
+
+        The kernel regenerates these files on every read at offset 0, so the
+        descriptor is kept open and re-read with pread instead of reopening
+        the path each sample. Raises FileNotFoundError if the file is missing.
+        """
+        fd = self._fds.get(path)
+        if fd is None:
+            fd = os.open(path, os.O_RDONLY)
+            self._fds[path] = fd
+        return os.pread(fd, size, 0)
         
     def read_temperature(self, zone_id):
         """Read temperature from thermal zone"""
+        if f'thermal_zone{zone_id}' not in self._present:
+            return None
+
+        temp_file = f'{THERMAL_CLASS_DIR}/thermal_zone{zone_id}/temp'
         try:
-            temp_file = Path(f'/sys/class/thermal/thermal_zone{zone_id}/temp')
-            if temp_file.exists():
-                with open(temp_file, 'r') as f:
-                    temp_millidegrees = int(f.read().strip())
-                return temp_millidegrees // 1000
-            else:
-                self.logger.warning(f"Temperature file not found: {temp_file}")
-                return None
+            temp_millidegrees = int(self._read_file(temp_file).strip())
+            return temp_millidegrees // 1000
+        except FileNotFoundError:
+            self.logger.warning(f"Temperature file not found: {temp_file}")
+            return None
         except Exception as e:
             self.logger.error(f"Error reading temperature from zone {zone_id}: {e}")
             return None
@@ -42,17 +103,19 @@ class SensorReader:
         fan_active = False
         
         for device_id in self.cooling_devices:
+            if f'cooling_device{device_id}' not in self._present:
+                fan_states.append(0)
+                continue
+
+            state_file = f'{THERMAL_CLASS_DIR}/cooling_device{device_id}/cur_state'
             try:
-                state_file = Path(f'/sys/class/thermal/cooling_device{device_id}/cur_state')
-                if state_file.exists():
-                    with open(state_file, 'r') as f:
-                        state = int(f.read().strip())
-                    fan_states.append(state)
-                    if state > 0:
-                        fan_active = True
-                else:
-                    self.logger.warning(f"Cooling device file not found: {state_file}")
-                    fan_states.append(0)
+                state = int(self._read_file(state_file).strip())
+                fan_states.append(state)
+                if state > 0:
+                    fan_active = True
+            except FileNotFoundError:
+                self.logger.warning(f"Cooling device file not found: {state_file}")
+                fan_states.append(0)
             except Exception as e:
                 self.logger.error(f"Error reading fan state {device_id}: {e}")
                 fan_states.append(0)
@@ -60,7 +123,19 @@ class SensorReader:
         return fan_states, fan_active
         
     def read_cpu_frequency(self):
-        """Read current CPU frequency"""
+        """Read current CPU frequency in MHz
+
+        Prefers the single-integer cpufreq sysfs file (kHz) and falls back to
+        scanning /proc/cpuinfo where cpufreq is not exposed (e.g. some
+        containers and VMs).
+        """
+        try:
+            return int(self._read_file(CPUFREQ_FILE, 32).strip()) // 1000
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error reading CPU frequency: {e}")
+
         try:
             cpuinfo_file = Path('/proc/cpuinfo')
             if cpuinfo_file.exists():
@@ -77,11 +152,9 @@ class SensorReader:
     def read_load_average(self):
         """Read system load average"""
         try:
-            loadavg_file = Path('/proc/loadavg')
-            if loadavg_file.exists():
-                with open(loadavg_file, 'r') as f:
-                    load_data = f.read().strip().split()
-                    return float(load_data[0])  # 1-minute average
+            load_data = self._read_file('/proc/loadavg', 128).split()
+            return float(load_data[0])  # 1-minute average
+        except FileNotFoundError:
             return None
         except Exception as e:
             self.logger.error(f"Error reading load average: {e}")
@@ -108,7 +181,7 @@ class SensorReader:
             'socket_temp': socket_temp or 0,
             'cpu_temp': cpu_temp or 0,
             'fan_active': int(fan_active),
-            'fan_states': ''.join(map(str, fan_states)),
+            'fan_states': _format_fan_states(fan_states),
             'cpu_freq': cpu_freq or 0,
             'load_avg': load_avg or 0.0
         }
@@ -153,8 +226,8 @@ class SensorReader:
         
         # Thermal zone information
         for zone_id in [self.thermal_zone_socket, self.thermal_zone_cpu]:
-            zone_path = Path(f'/sys/class/thermal/thermal_zone{zone_id}')
-            if zone_path.exists():
+            zone_path = Path(f'{THERMAL_CLASS_DIR}/thermal_zone{zone_id}')
+            if zone_path.name in self._present:
                 try:
                     type_file = zone_path / 'type'
                     zone_type = 'unknown'
@@ -175,8 +248,8 @@ class SensorReader:
                     
         # Cooling device information
         for device_id in self.cooling_devices:
-            device_path = Path(f'/sys/class/thermal/cooling_device{device_id}')
-            if device_path.exists():
+            device_path = Path(f'{THERMAL_CLASS_DIR}/cooling_device{device_id}')
+            if device_path.name in self._present:
                 try:
                     type_file = device_path / 'type'
                     device_type = 'unknown'
@@ -204,7 +277,9 @@ class SensorReader:
                     
         # System information
         info['system_info'] = {
-            'cpu_frequency_available': Path('/proc/cpuinfo').exists(),
+            'cpu_frequency_available': (
+                Path(CPUFREQ_FILE).exists() or Path('/proc/cpuinfo').exists()
+            ),
             'load_average_available': Path('/proc/loadavg').exists(),
             'timestamp': datetime.now().isoformat()
         }
@@ -3,13 +3,36 @@
 Logging configuration utilities
 """
 
+import queue
+import atexit
+import functools
 import logging
 import logging.handlers
 from pathlib import Path
 
 
+# Background listener that owns the real (blocking) handlers
+_queue_listener = None
+
+# Size suffix multipliers; 'K', 'M' and 'G' are aliases for 'KB', 'MB', 'GB'
+_SIZE_SUFFIXES = {
+    'GB': 1 << 30,
+    'MB': 1 << 20,
+    'KB': 1 << 10,
+    'G': 1 << 30,
+    'M': 1 << 20,
+    'K': 1 << 10,
+    'B': 1
+}
+
+
 def setup_logging(config):
-    """Setup logging configuration"""
+    """Setup logging configuration
+
+    The root logger only enqueues records; file and console output is done
+    by a QueueListener thread so callers never block on log I/O.
+    """
+    global _queue_listener
     
     # Default configuration
     log_config = {
@@ -32,7 +55,9 @@ def setup_logging(config):
     logger.setLevel(getattr(logging, log_config['level'].upper()))
     
     # Clear existing handlers
+    stop_logging()
     logger.handlers.clear()
+    handlers = []
     
     # File handler with rotation
     max_bytes = _parse_size(log_config['max_size'])
@@ -46,7 +71,7 @@ def setup_logging(config):
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+    handlers.append(file_handler)
     
     # Console handler
     if log_config.get('console', True):
@@ -56,11 +81,31 @@ def setup_logging(config):
             datefmt='%H:%M:%S'
         )
         console_handler.setFormatter(console_formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _queue_listener.start()
     
     return logger
 
 
+def stop_logging():
+    """Flush queued log records and stop the background listener"""
+    global _queue_listener
+
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(stop_logging)
+
+
+@functools.lru_cache(maxsize=8)
 def _parse_size(size_str):
     """Parse size string like '10MB' into bytes"""
     if isinstance(size_str, (int, float)):
@@ -68,28 +113,23 @@ def _parse_size(size_str):
 
     size_str = str(size_str).upper().strip()
 
-    multipliers = {
-        'GB': 1024 * 1024 * 1024,
-        'MB': 1024 * 1024,
-        'KB': 1024,
-        'M': 1024 * 1024,  # Support 'M' as alias for 'MB'
-        'K': 1024,         # Support 'K' as alias for 'KB'
-        'G': 1024 * 1024 * 1024,  # Support 'G' as alias for 'GB'
-        'B': 1
-    }
+    # Two-letter suffixes first so 'MB' isn't read as 'B'
+    multiplier = _SIZE_SUFFIXES.get(size_str[-2:])
+    suffix_len = 2
+    if multiplier is None:
+        multiplier = _SIZE_SUFFIXES.get(size_str[-1:])
+        suffix_len = 1
 
-    # Check suffixes from longest to shortest to avoid partial matches
-    for suffix, multiplier in multipliers.items():
-        if size_str.endswith(suffix):
-            number_str = size_str[:-len(suffix)].strip()
-            try:
-                number = float(number_str)
-                return int(number * multiplier)
-            except ValueError:
-                raise ValueError(f"Invalid size format: '{size_str}' - cannot parse number part")
+    if multiplier is not None:
+        number_str = size_str[:-suffix_len].strip()
+        try:
+            number = float(number_str)
+            return int(number * multiplier)
+        except ValueError:
+            raise ValueError(f"Invalid size format: '{size_str}' - cannot parse number part")
 
     # If no suffix, try to parse as bytes
     try:
         return int(float(size_str))
     except ValueError:
-        raise ValueError(f"Invalid size format: '{size_str}' - expected number with optional suffix (B, KB, MB, GB)")
\ No newline at end of file
+        raise ValueError(f"Invalid size format: '{size_str}' - expected number with optional suffix (B, KB, MB, GB)")
@@ -6,11 +6,43 @@ Handles rate limiting, priority, and notification types
 
 import time
 import logging
-from datetime import datetime, timedelta
+import threading
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# History timestamps are monotonic nanoseconds
+_NS_PER_SEC = 1_000_000_000
+_DEFAULT_RATE_LIMIT_NS = 900 * _NS_PER_SEC  # 15 minutes
+_MINUTE_NS = 60 * _NS_PER_SEC
+
+
+def _iso_timestamp(ts=None):
+    """Format an epoch time (default now) as a local ISO 8601 string"""
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(ts))
 
 
 class NotificationManager:
     """Manage notifications with rate limiting and priorities"""
+
+    # Data attached to every notification
+    _BASE_DATA = {'tag': 'nucbox-thermal'}
+
+    # Priority-specific notification data
+    _PRIORITY_DATA = {
+        'critical': {'color': 'red', 'sound': 'alarm', 'persistent': True},
+        'high': {'color': 'orange', 'sound': 'default'},
+        'normal': {'color': 'blue', 'sound': 'none'}
+    }
+    
+    # Priorities whose rate limit is resolved up front
+    _PRIORITIES = ('critical', 'high', 'normal', 'info', 'warning')
+    
+    # Sends between opportunistic purges of expired history
+    _PURGE_EVERY = 100
+    
+    # Number of recent (type, title, message) sends remembered for dedup
+    _DEDUP_MAXLEN = 256
     
     def __init__(self, ha_client, config=None):
         self.ha_client = ha_client
@@ -25,8 +57,15 @@ class NotificationManager:
             'normal': 900       # 15 minutes
         })
         
-        # Enabled notification types
-        self.enabled_types = set(self.config.get('enabled_types', [
+        # Base plus priority-specific data, merged once per priority
+        self._payload_templates = {
+            priority: {**self._BASE_DATA, **data}
+            for priority, data in self._PRIORITY_DATA.items()
+        }
+        self._resolve_rate_limits()
+        
+        # Enabled notification types (read-only; rebuilt when changed)
+        self.enabled_types = frozenset(self.config.get('enabled_types', [
             'temperature_critical',
             'temperature_warning',
             'fan_state_change', 
@@ -34,140 +73,367 @@ class NotificationManager:
             'workload_complete'
         ]))
         
-        # Track last notification times
+        # Cap on sends per notification type per minute, across priorities
+        self.max_per_minute = self.config.get('max_per_minute', 5)
+        
+        # Cap on non-critical sends per minute across all types
+        self.max_global_per_minute = self.config.get('max_global_per_minute', 20)
+        
+        # Window (seconds) during which an identical notification is dropped
+        self.dedup_window = self.config.get('dedup_window', 300)
+        self._dedup_window_ns = int(self.dedup_window * _NS_PER_SEC)
+        
+        # Track last notification times, keyed by (notification_type, priority).
+        # Rate limiting uses monotonic ns; wall-clock times are kept for display.
         self.last_notifications = {}
+        self._last_sent_wall = {}
+        self._type_send_times = defaultdict(deque)
+        self._global_send_times = deque()
+        self._suppressed = Counter()  # suppressed sends by reason
+        self._recent = OrderedDict()
+        self._sends_since_purge = 0
+        self._lock = threading.Lock()  # guards history when sends run concurrently
+        
+        # Worker pool for send_notification_async
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.get('max_concurrency', 3),
+            thread_name_prefix='notify'
+        )
         
     def send_notification(self, title, message, priority='normal', notification_type=None):
         """Send notification with rate limiting"""
         
-        # Check if notification type is enabled
-        if notification_type and notification_type not in self.enabled_types:
-            self.logger.debug(f"Notification type {notification_type} is disabled")
-            return False
+        key = (notification_type, priority)
+        rate_limit, template = self._by_priority.get(priority, self._unknown_priority)
+        now = time.monotonic_ns()
+        
+        # Untyped notifications bypass type filtering and rate limiting
+        if notification_type:
+            dedup_key = (notification_type, title, message)
             
-        # Check rate limiting
-        if not self._check_rate_limit(notification_type, priority):
-            self.logger.debug(f"Rate limit hit for {notification_type} ({priority})")
-            return False
+            # Check and reserve the slot atomically so concurrent identical
+            # sends can't all pass while the first is still in flight
+            with self._lock:
+                # Check if notification type is enabled
+                if notification_type not in self.enabled_types:
+                    self.logger.debug("Notification type %s is disabled", notification_type)
+                    self._suppressed['disabled'] += 1
+                    return False
+                    
+                # Drop repeats of an identical notification, whatever its priority
+                recent_sent = self._recent.get(dedup_key)
+                if recent_sent is not None and now - recent_sent < self._dedup_window_ns:
+                    self.logger.debug("Duplicate notification dropped: %s", title)
+                    self._suppressed['duplicate'] += 1
+                    return False
+                    
+                # Check rate limiting
+                if self._is_rate_limited(key, rate_limit, now):
+                    self.logger.debug("Rate limit hit for %s (%s)", notification_type, priority)
+                    self._suppressed['rate_limit'] += 1
+                    return False
+                    
+                # Check per-type and global push rates; critical alerts are never held back
+                if priority != 'critical':
+                    if not self._check_type_rate(notification_type, now):
+                        self.logger.debug("Per-minute limit hit for %s", notification_type)
+                        self._suppressed['type_rate'] += 1
+                        return False
+                        
+                    if not self._check_global_rate(now):
+                        self.logger.debug("Global per-minute limit hit, dropping %s", notification_type)
+                        self._suppressed['global_rate'] += 1
+                        return False
+                        
+                previous = self._reserve(key, dedup_key, now)
             
-        # Prepare notification data
+        # Prepare notification data only once every filter has passed
         notification_data = {
+            **template,
             'priority': priority,
-            'tag': 'nucbox-thermal',
             'notification_type': notification_type,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _iso_timestamp()
         }
-        
-        # Add priority-specific data
-        if priority == 'critical':
-            notification_data.update({
-                'color': 'red',
-                'sound': 'alarm',
-                'persistent': True
-            })
-        elif priority == 'high':
-            notification_data.update({
-                'color': 'orange', 
-                'sound': 'default'
-            })
-        elif priority == 'normal':
-            notification_data.update({
-                'color': 'blue',
-                'sound': 'none'
-            })
             
         # Send notification
         success = self.ha_client.send_notification(title, message, notification_data)
         
         if success:
-            # Update rate limiting tracker
-            key = f"{notification_type}_{priority}"
-            self.last_notifications[key] = time.time()
-            self.logger.info(f"Notification sent: {title} ({priority})")
+            if not notification_type:
+                with self._lock:
+                    self._record(key, now)
+            self.logger.info("Notification sent: %s (%s)", title, priority)
         else:
-            self.logger.error(f"Failed to send notification: {title}")
+            if notification_type:
+                # Give the slot back so a retry isn't rate limited
+                with self._lock:
+                    self._release(key, dedup_key, now, previous)
+            self.logger.error("Failed to send notification: %s", title)
             
         return success
         
+    def send_notification_async(self, title, message, priority='normal', notification_type=None):
+        """Send notification without blocking on the Home Assistant round trip
+
+        Returns a concurrent.futures.Future resolving to send_notification's result.
+        """
+        return self._executor.submit(self.send_notification, title, message, priority, notification_type)
+        
     def _check_rate_limit(self, notification_type, priority):
-        """Check if notification passes rate limiting"""
+        """Check if notification passes rate limiting
+
+        Thin wrapper over the check send_notification makes, for external
+        callers.
+        """
+        if not notification_type:
+            return True
+            
+        rate_limit = self._by_priority.get(priority, self._unknown_priority)[0]
+        with self._lock:
+            return not self._is_rate_limited(
+                (notification_type, priority), rate_limit, time.monotonic_ns()
+            )
+        
+    def _is_rate_limited(self, key, rate_limit, now):
+        """Whether key was sent less than rate_limit ns ago
+
+        Caller holds self._lock.
+        """
+        last_sent = self.last_notifications.get(key)
+        return last_sent is not None and now - last_sent < rate_limit
+        
+    def _check_type_rate(self, notification_type, now=None):
+        """Check that a notification type is under its per-minute cap
+
+        now is a time.monotonic_ns() reading; taken fresh when omitted.
+        Caller holds self._lock.
+        """
         if not notification_type:
             return True
             
-        key = f"{notification_type}_{priority}"
-        last_sent = self.last_notifications.get(key, 0)
-        rate_limit = self.rate_limits.get(priority, 900)  # Default 15 minutes
+        send_times = self._type_send_times.get(notification_type)
+        if not send_times:
+            return True
+            
+        if now is None:
+            now = time.monotonic_ns()
+        return self._window_count(send_times, now) < self.max_per_minute
+        
+    def _check_global_rate(self, now=None):
+        """Check that all typed sends together are under the global per-minute cap
+
+        Caller holds self._lock.
+        """
+        if now is None:
+            now = time.monotonic_ns()
+        return self._window_count(self._global_send_times, now) < self.max_global_per_minute
+        
+    def _window_count(self, send_times, now):
+        """Drop sends older than the one-minute window and count the rest
+
+        Caller holds self._lock.
+        """
+        cutoff = now - _MINUTE_NS
+        while send_times and send_times[0] <= cutoff:
+            send_times.popleft()
+        return len(send_times)
+        
+    def _resolve_rate_limits(self):
+        """Materialize per-priority rate limits in seconds and nanoseconds"""
+        rate_limits = self.rate_limits
+        self._rl = {p: rate_limits.get(p, 900) for p in self._PRIORITIES}
+        self._rl.update(rate_limits)
+        self._rl_ns = {p: int(v * _NS_PER_SEC) for p, v in self._rl.items()}
+        
+        # (rate limit ns, payload template) so the send path does one lookup
+        templates_get = self._payload_templates.get
+        self._by_priority = {
+            p: (rl_ns, templates_get(p, self._BASE_DATA))
+            for p, rl_ns in self._rl_ns.items()
+        }
+        self._unknown_priority = (_DEFAULT_RATE_LIMIT_NS, self._BASE_DATA)
+        
+    def _record(self, key, now):
+        """Record a send in the rate-limit history; caller holds self._lock"""
+        self._sends_since_purge += 1
+        if self._sends_since_purge >= self._PURGE_EVERY:
+            self._purge_expired(now)
+        self.last_notifications[key] = now
+        self._last_sent_wall[key] = time.time()
+        
+    def _reserve(self, key, dedup_key, now):
+        """Claim a typed send ahead of the HA call; caller holds self._lock
+
+        Returns the entries it replaced, for _release.
+        """
+        previous = (
+            self.last_notifications.get(key),
+            self._last_sent_wall.get(key),
+            self._recent.get(dedup_key)
+        )
+        self._record(key, now)
+        self._type_send_times[key[0]].append(now)
+        self._global_send_times.append(now)
+        self._remember(dedup_key, now)
+        return previous
+        
+    def _release(self, key, dedup_key, now, previous):
+        """Undo a _reserve whose send failed; caller holds self._lock"""
+        last_sent, last_sent_wall, recent_sent = previous
+        
+        # Only roll back entries a later send hasn't already replaced
+        if self.last_notifications.get(key) == now:
+            if last_sent is None:
+                del self.last_notifications[key]
+                self._last_sent_wall.pop(key, None)
+            else:
+                self.last_notifications[key] = last_sent
+                self._last_sent_wall[key] = last_sent_wall
+                
+        if self._recent.get(dedup_key) == now:
+            if recent_sent is None:
+                del self._recent[dedup_key]
+            else:
+                self._recent[dedup_key] = recent_sent
+                
+        for send_times in (self._type_send_times.get(key[0]), self._global_send_times):
+            if send_times:
+                try:
+                    send_times.remove(now)
+                except ValueError:
+                    pass
         
-        time_since_last = time.time() - last_sent
+    def _remember(self, dedup_key, now):
+        """Record a sent notification in the bounded dedup LRU"""
+        recent = self._recent
+        recent[dedup_key] = now
+        recent.move_to_end(dedup_key)
+        if len(recent) > self._DEDUP_MAXLEN:
+            recent.popitem(last=False)
         
-        return time_since_last >= rate_limit
+    def _purge_expired(self, now):
+        """Drop history whose rate-limit window has already elapsed
+
+        Keeps the tracking dicts bounded by the notifications still inside
+        their window instead of growing forever. Caller holds self._lock.
+        """
+        self._sends_since_purge = 0
+        limits_get = self._rl_ns.get
+        
+        stale = [
+            key for key, last_sent in self.last_notifications.items()
+            if now - last_sent >= limits_get(key[1], _DEFAULT_RATE_LIMIT_NS)
+        ]
+        for key in stale:
+            del self.last_notifications[key]
+            self._last_sent_wall.pop(key, None)
+            
+        minute_ago = now - _MINUTE_NS
+        idle = [
+            ntype for ntype, send_times in self._type_send_times.items()
+            if not send_times or send_times[-1] <= minute_ago
+        ]
+        for ntype in idle:
+            del self._type_send_times[ntype]
         
     def send_critical_alert(self, title, message, notification_type=None):
         """Send critical priority notification"""
-        return self.send_notification(
-            title, 
-            message, 
-            priority='critical',
-            notification_type=notification_type
-        )
+        return self.send_notification(title, message, 'critical', notification_type)
         
     def send_warning(self, title, message, notification_type=None):
         """Send warning priority notification"""
-        return self.send_notification(
-            title,
-            message,
-            priority='high', 
-            notification_type=notification_type
-        )
+        return self.send_notification(title, message, 'high', notification_type)
         
     def send_info(self, title, message, notification_type=None):
         """Send info priority notification"""
-        return self.send_notification(
-            title,
-            message,
-            priority='normal',
-            notification_type=notification_type
-        )
+        return self.send_notification(title, message, 'normal', notification_type)
         
     def clear_rate_limits(self):
         """Clear all rate limiting history"""
-        self.last_notifications.clear()
+        with self._lock:
+            self.last_notifications.clear()
+            self._last_sent_wall.clear()
+            self._type_send_times.clear()
+            self._global_send_times.clear()
+            self._recent.clear()
         self.logger.info("Rate limiting history cleared")
         
     def get_notification_status(self):
         """Get current notification status"""
-        current_time = time.time()
+        now = time.monotonic_ns()
         status = {}
+        with self._lock:
+            self._purge_expired(now)
+            wall_get = self._last_sent_wall.get
+            history = [
+                (key, last_sent, wall_get(key))
+                for key, last_sent in self.last_notifications.items()
+            ]
         
-        for key, last_sent in self.last_notifications.items():
-            notification_type, priority = key.rsplit('_', 1)
-            rate_limit = self.rate_limits.get(priority, 900)
-            time_since_last = current_time - last_sent
+        # Local bindings for the loop
+        limits_get = self._rl_ns.get
+        iso_timestamp = _iso_timestamp
+        
+        for (notification_type, priority), last_sent, last_sent_wall in history:
+            rate_limit = limits_get(priority, _DEFAULT_RATE_LIMIT_NS)
+            time_since_last = now - last_sent
             time_until_next = max(0, rate_limit - time_since_last)
             
-            status[key] = {
-                'last_sent': datetime.fromtimestamp(last_sent).isoformat(),
-                'time_since_last': int(time_since_last),
-                'time_until_next': int(time_until_next),
+            status[f"{notification_type}_{priority}"] = {
+                'last_sent': iso_timestamp(last_sent_wall) if last_sent_wall else None,
+                'time_since_last': time_since_last // _NS_PER_SEC,
+                'time_until_next': time_until_next // _NS_PER_SEC,
                 'can_send': time_until_next == 0
             }
             
         return status
         
+    def get_suppression_counts(self):
+        """Get the number of suppressed notifications by reason"""
+        with self._lock:
+            return dict(self._suppressed)
+        
     def update_config(self, new_config):
         """Update notification configuration"""
         self.config.update(new_config)
         
         # Update rate limits
         if 'rate_limit' in new_config:
-            self.rate_limits.update(new_config['rate_limit'])
+            with self._lock:
+                self.rate_limits.update(new_config['rate_limit'])
+                self._resolve_rate_limits()
+            
+        if 'max_per_minute' in new_config:
+            self.max_per_minute = new_config['max_per_minute']
+            
+        if 'max_global_per_minute' in new_config:
+            self.max_global_per_minute = new_config['max_global_per_minute']
+            
+        if 'dedup_window' in new_config:
+            self.dedup_window = new_config['dedup_window']
+            self._dedup_window_ns = int(self.dedup_window * _NS_PER_SEC)
             
         # Update enabled types
         if 'enabled_types' in new_config:
-            self.enabled_types = set(new_config['enabled_types'])
+            self.enabled_types = frozenset(new_config['enabled_types'])
+            
+        # Incremental changes to enabled types
+        if 'enabled_types_add' in new_config:
+            self.enabled_types = self.enabled_types.union(new_config['enabled_types_add'])
+            
+        if 'enabled_types_remove' in new_config:
+            self.enabled_types = self.enabled_types.difference(new_config['enabled_types_remove'])
             
         self.logger.info("Notification configuration updated")
         
+    def enable_type(self, notification_type):
+        """Enable a notification type"""
+        self.enabled_types = self.enabled_types | {notification_type}
+        
+    def disable_type(self, notification_type):
+        """Disable a notification type"""
+        self.enabled_types = self.enabled_types - {notification_type}
+        
     def test_notifications(self):
         """Send test notifications for each priority level"""
         test_notifications = [
@@ -176,15 +442,14 @@ class NotificationManager:
             ('critical', '🚨 Test Critical Priority', 'This is a critical priority test notification')
         ]
         
-        results = {}
-        for priority, title, message in test_notifications:
-            success = self.send_notification(
-                title, 
-                message,
-                priority=priority,
-                notification_type='test'
-            )
-            results[priority] = success
-            time.sleep(1)  # Brief delay between tests
+        # Sends are independent HTTP calls, so issue them concurrently
+        futures = {
+            priority: self.send_notification_async(title, message, priority, 'test')
+            for priority, title, message in test_notifications
+        }
             
-        return results
\ No newline at end of file
+        return {priority: future.result() for priority, future in futures.items()}
+        
+    def close(self):
+        """Shut down the async send worker pool"""
+        self._executor.shutdown(wait=False)
\ No newline at end of file
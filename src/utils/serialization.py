@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+JSON serialization helpers
+Uses orjson when available and falls back to the standard library
+"""
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+if orjson is not None:
+    def loads(data):
+        """Decode JSON from bytes or str"""
+        return orjson.loads(data)
+
+    def dumps(obj):
+        """Encode an object as JSON bytes"""
+        return orjson.dumps(obj)
+else:
+    def loads(data):
+        """Decode JSON from bytes or str"""
+        return json.loads(data)
+
+    def dumps(obj):
+        """Encode an object as JSON bytes"""
+        return json.dumps(obj).encode()